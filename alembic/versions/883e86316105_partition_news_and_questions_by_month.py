@@ -0,0 +1,132 @@
+"""partition news and questions by month
+
+Revision ID: 883e86316105
+Revises: a6e70dfa0d26
+Create Date: 2026-10-19 16:42:05.338719
+
+Rebuilds news and questions as tables range-partitioned by month on
+created_at. Rows are copied over inside the migration, so both tables are
+locked for its duration; run it in a maintenance window. The primary key
+becomes (id, created_at), which Postgres requires of a partitioned table,
+and question_stats loses its foreign key to questions for the same reason.
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from app.partitions import PARTITION_MONTHS_AHEAD, add_months, current_month, partition_ddl
+
+
+# revision identifiers, used by Alembic.
+revision: str = '883e86316105'
+down_revision: Union[str, Sequence[str], None] = 'a6e70dfa0d26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = {
+    'news': {
+        'columns': lambda: [
+            sa.Column('title', sa.String(), nullable=True),
+            sa.Column('content', sa.String(), nullable=True),
+            sa.Column('image_url', sa.String(), nullable=True),
+        ],
+        'copy': 'id, title, content, image_url',
+        'index': 'title',
+    },
+    'questions': {
+        'columns': lambda: [
+            sa.Column('text', sa.String(), nullable=True),
+            sa.Column('answer', sa.String(), nullable=True),
+        ],
+        'copy': 'id, text, answer',
+        'index': 'text',
+    },
+}
+
+
+def _first_month(table: str) -> date:
+    oldest = op.get_bind().execute(sa.text(f"SELECT min(created_at) FROM {table}_unpartitioned")).scalar()
+    return oldest.date().replace(day=1) if oldest else current_month()
+
+
+def _create_partitions_offline(table: str):
+    # With --sql the oldest row is unknown until the script runs, so the
+    # script finds it itself; starting at the current month would send
+    # every existing row to <table>_default, where archive() never sees it.
+    # Same names and bounds as app.partitions.partition_ddl.
+    op.execute(f"""
+DO $$
+DECLARE
+    first_day date := date_trunc('month', COALESCE((SELECT min(created_at) FROM {table}_unpartitioned), now()) AT TIME ZONE 'UTC')::date;
+BEGIN
+    WHILE first_day <= (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '{PARTITION_MONTHS_AHEAD} months')::date LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+            '{table}_p' || to_char(first_day, 'YYYY_MM'),
+            to_char(first_day, 'YYYY-MM-DD') || ' 00:00:00+00',
+            to_char(first_day + interval '1 month', 'YYYY-MM-DD') || ' 00:00:00+00'
+        );
+        first_day := first_day + interval '1 month';
+    END LOOP;
+END $$""")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_constraint('question_stats_question_id_fkey', 'question_stats', type_='foreignkey')
+
+    for table, spec in TABLES.items():
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+        op.execute(f"ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey")
+        op.create_table(table,
+        sa.Column('id', sa.Integer(), server_default=sa.text(f"nextval('{table}_id_seq'::regclass)"), nullable=False),
+        *spec['columns'](),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)'
+        )
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+        # Rows outside every monthly partition land here instead of failing
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        if context.is_offline_mode():
+            _create_partitions_offline(table)
+        else:
+            month = _first_month(table)
+            last = add_months(current_month(), PARTITION_MONTHS_AHEAD)
+            while month <= last:
+                op.execute(partition_ddl(table, month))
+                month = add_months(month, 1)
+
+        op.execute(
+            f"INSERT INTO {table} ({spec['copy']}, created_at) "
+            f"SELECT {spec['copy']}, COALESCE(created_at, now()) FROM {table}_unpartitioned"
+        )
+        op.drop_table(f'{table}_unpartitioned')
+        op.create_index(op.f(f'ix_{table}_created_at'), table, ['created_at'], unique=False)
+        op.create_index(op.f(f"ix_{table}_{spec['index']}"), table, [spec['index']], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, spec in TABLES.items():
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+        op.execute(f"ALTER TABLE {table}_partitioned RENAME CONSTRAINT {table}_pkey TO {table}_partitioned_pkey")
+        op.drop_index(op.f(f'ix_{table}_created_at'), table_name=f'{table}_partitioned')
+        op.drop_index(op.f(f"ix_{table}_{spec['index']}"), table_name=f'{table}_partitioned')
+        op.create_table(table,
+        sa.Column('id', sa.Integer(), server_default=sa.text(f"nextval('{table}_id_seq'::regclass)"), nullable=False),
+        *spec['columns'](),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        op.execute(f"INSERT INTO {table} ({spec['copy']}, created_at) SELECT {spec['copy']}, created_at FROM {table}_partitioned")
+        op.drop_table(f'{table}_partitioned')
+        op.create_index(op.f(f'ix_{table}_created_at'), table, ['created_at'], unique=False)
+        op.create_index(op.f(f"ix_{table}_{spec['index']}"), table, [spec['index']], unique=False)
+
+    op.create_foreign_key('question_stats_question_id_fkey', 'question_stats', 'questions', ['question_id'], ['id'])
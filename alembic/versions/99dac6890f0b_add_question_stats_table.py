@@ -0,0 +1,44 @@
+"""add question_stats table
+
+Revision ID: 99dac6890f0b
+Revises: 8866385dc566
+Create Date: 2026-10-19 11:03:17.552910
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '99dac6890f0b'
+down_revision: Union[str, Sequence[str], None] = '8866385dc566'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('question_stats',
+    sa.Column('question_id', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('correct', sa.Integer(), nullable=False),
+    sa.Column('distinct_users', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['question_id'], ['questions.id'], ),
+    sa.PrimaryKeyConstraint('question_id')
+    )
+    op.create_index('ix_question_stats_attempts', 'question_stats', ['attempts', 'question_id'], unique=False)
+    op.create_index('ix_question_stats_correct', 'question_stats', ['correct', 'question_id'], unique=False)
+    op.create_index('ix_question_stats_distinct_users', 'question_stats', ['distinct_users', 'question_id'], unique=False)
+    op.create_index('ix_question_stats_accuracy', 'question_stats', [sa.text('(CAST(correct AS FLOAT) / CAST(nullif(attempts, 0) AS FLOAT))'), 'question_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_question_stats_accuracy', table_name='question_stats')
+    op.drop_index('ix_question_stats_distinct_users', table_name='question_stats')
+    op.drop_index('ix_question_stats_correct', table_name='question_stats')
+    op.drop_index('ix_question_stats_attempts', table_name='question_stats')
+    op.drop_table('question_stats')
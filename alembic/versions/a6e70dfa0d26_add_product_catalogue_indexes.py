@@ -0,0 +1,34 @@
+"""add product catalogue indexes
+
+Revision ID: a6e70dfa0d26
+Revises: d4a6ecec21c0
+Create Date: 2026-10-19 15:08:34.271946
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.migration_ops import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6e70dfa0d26'
+down_revision: Union[str, Sequence[str], None] = 'd4a6ecec21c0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    create_index_concurrently('ix_products_publish_at_id', 'products', ['publish_at', 'id'])
+    create_index_concurrently('ix_products_price_id', 'products', ['price', 'id'])
+    create_index_concurrently('ix_products_name_c_id', 'products', [sa.text('(name COLLATE "C")'), 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_index_concurrently('ix_products_name_c_id', 'products')
+    drop_index_concurrently('ix_products_price_id', 'products')
+    drop_index_concurrently('ix_products_publish_at_id', 'products')
@@ -0,0 +1,47 @@
+"""drop redundant pk indexes, index created_at listings
+
+Revision ID: d4a6ecec21c0
+Revises: 99dac6890f0b
+Create Date: 2026-10-19 13:27:51.904417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.migration_ops import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a6ecec21c0'
+down_revision: Union[str, Sequence[str], None] = '99dac6890f0b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every primary key already has its own unique index; these duplicates only
+# cost write amplification and vacuum time.
+PK_INDEXES = [
+    ('ix_users_id', 'users'),
+    ('ix_news_id', 'news'),
+    ('ix_products_id', 'products'),
+    ('ix_questions_id', 'questions'),
+    ('ix_user_profiles_id', 'user_profiles'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # crud.get_news / crud.get_questions: ORDER BY created_at DESC LIMIT n
+    create_index_concurrently(op.f('ix_news_created_at'), 'news', ['created_at'])
+    create_index_concurrently(op.f('ix_questions_created_at'), 'questions', ['created_at'])
+    for index_name, table_name in PK_INDEXES:
+        drop_index_concurrently(op.f(index_name), table_name)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for index_name, table_name in PK_INDEXES:
+        create_index_concurrently(op.f(index_name), table_name, ['id'])
+    drop_index_concurrently(op.f('ix_questions_created_at'), 'questions')
+    drop_index_concurrently(op.f('ix_news_created_at'), 'news')
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+
+from dotenv import load_dotenv
+
+from app import database
+
+load_dotenv()
+
+# Route classes, highest priority first. Gameplay keeps its queue and its
+# full limit when the app is under pressure; once the total number of
+# requests in flight crosses ADMISSION_PRESSURE every other class stops
+# queueing and is cut down to its pressure limit, leaving the database pool
+# to gameplay.
+GAMEPLAY = "gameplay"
+AUTH = "auth"
+PUBLIC = "public"
+ADMIN = "admin"
+
+# Default limits are sized to the connection pool: an admitted request that
+# still had to wait for a connection would sit in SQLAlchemy's pool queue,
+# outside any lane deadline.
+DB_CAPACITY = database.DB_POOL_SIZE + database.DB_MAX_OVERFLOW
+ADMISSION_PRESSURE = int(os.getenv("ADMISSION_PRESSURE", DB_CAPACITY))
+SHED_LOG_INTERVAL = 10
+
+_CHECK_PATH = re.compile(r"^/questions/[^/]+/check/?$")
+_NEXT_PATH = "/questions/next"
+_AUTH_PATHS = {"/signup", "/login", "/token"}
+_PUBLIC_PATHS = {"/news", "/products"}
+_MEDIA_PREFIX = "/media/"
+_ADMIN_PREFIXES = ("/news", "/products", "/questions")
+
+
+def classify(method: str, path: str):
+    """Maps a request onto its admission class, or None to bypass admission."""
+    if method == "POST" and _CHECK_PATH.match(path):
+        return GAMEPLAY
+    if method == "GET" and path.rstrip("/") == _NEXT_PATH:
+        return GAMEPLAY
+    if method == "POST" and path.rstrip("/") in _AUTH_PATHS:
+        return AUTH
+    if method == "GET" and (path.rstrip("/") in _PUBLIC_PATHS or path.startswith(_MEDIA_PREFIX)):
+        return PUBLIC
+    if method in ("POST", "PUT", "PATCH", "DELETE") and _under(path, _ADMIN_PREFIXES):
+        return ADMIN
+    return None
+
+
+def _under(path: str, prefixes: tuple) -> bool:
+    # Match whole path segments so /newsletter is not treated as /news
+    return any(path == prefix or path.startswith(prefix + "/") for prefix in prefixes)
+
+
+class Lane:
+    """Concurrency limit plus a bounded, deadline-aware wait queue for one route class."""
+
+    def __init__(self, name: str, limit: int, queue: int, timeout: float, retry_after: int, priority: int, pressure_limit: int):
+        self.name = name
+        self.limit = limit
+        self.pressure_limit = min(pressure_limit, limit)
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.priority = priority
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self._logged_at = 0.0
+        self._logged_shed = 0
+
+    async def acquire(self, under_pressure: bool) -> bool:
+        if under_pressure and self.priority > 0 and self.active >= self.pressure_limit:
+            self.shed += 1
+            return False
+
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return self._admit()
+
+        queue = self.queue if (self.priority == 0 or not under_pressure) else 0
+        if self.waiting >= queue:
+            self.shed += 1
+            return False
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            self.shed += 1
+            return False
+        finally:
+            self.waiting -= 1
+        return self._admit()
+
+    def _admit(self) -> bool:
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def log_shed(self):
+        # One line per lane per interval; the counters carry the detail
+        now = time.monotonic()
+        if now - self._logged_at >= SHED_LOG_INTERVAL:
+            logging.warning(f"Shed {self.shed - self._logged_shed} {self.name} requests in the last {SHED_LOG_INTERVAL}s")
+            self._logged_at = now
+            self._logged_shed = self.shed
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "pressure_limit": self.pressure_limit,
+            "queue_limit": self.queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+def _lane_from_env(name: str, priority: int, limit: int, queue: int, timeout: float, retry_after: int, pressure_limit: int) -> Lane:
+    prefix = f"ADMISSION_{name.upper()}_"
+    return Lane(
+        name,
+        limit=int(os.getenv(prefix + "LIMIT", limit)),
+        queue=int(os.getenv(prefix + "QUEUE", queue)),
+        timeout=float(os.getenv(prefix + "TIMEOUT", timeout)),
+        retry_after=int(os.getenv(prefix + "RETRY_AFTER", retry_after)),
+        priority=priority,
+        pressure_limit=int(os.getenv(prefix + "PRESSURE_LIMIT", pressure_limit)),
+    )
+
+
+lanes = {
+    GAMEPLAY: _lane_from_env(GAMEPLAY, 0, limit=DB_CAPACITY, queue=4 * DB_CAPACITY, timeout=2.0, retry_after=1, pressure_limit=DB_CAPACITY),
+    AUTH: _lane_from_env(AUTH, 1, limit=max(1, DB_CAPACITY // 4), queue=DB_CAPACITY, timeout=3.0, retry_after=2, pressure_limit=1),
+    PUBLIC: _lane_from_env(PUBLIC, 2, limit=max(1, DB_CAPACITY // 4), queue=2 * DB_CAPACITY, timeout=1.0, retry_after=1, pressure_limit=1),
+    ADMIN: _lane_from_env(ADMIN, 3, limit=1, queue=4, timeout=5.0, retry_after=5, pressure_limit=1),
+}
+
+
+def in_flight() -> int:
+    return sum(lane.active + lane.waiting for lane in lanes.values())
+
+
+def stats() -> dict:
+    return {
+        "in_flight": in_flight(),
+        "pressure_threshold": ADMISSION_PRESSURE,
+        "lanes": {name: lane.stats() for name, lane in lanes.items()},
+    }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that admits requests per route class and answers 503 with
+    Retry-After instead of letting them queue inside uvicorn without bound.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        name = classify(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        lane = lanes[name]
+        if not await lane.acquire(in_flight() >= ADMISSION_PRESSURE):
+            lane.log_shed()
+            await _reject(send, lane)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release()
+
+
+async def _reject(send, lane: Lane):
+    body = json.dumps({"detail": "Server is busy, please retry later"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(lane.retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,132 @@
+"""
+Audits the hot-path queries against the indexes that exist in the database.
+
+Each query in HOT_PATHS is run through its real crud function inside a
+transaction that is rolled back; the SQL it emits is captured and
+re-planned with EXPLAIN. Sequential scans are reported as missing
+indexes, and indexes no hot path uses are listed as candidates for
+removal. Exits non-zero when a sequential scan is found.
+
+    python -m app.audit_indexes [--allow-seqscan]
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, database, question_stats
+
+HOT_PATHS = {
+    "crud.get_user_by_phone": lambda db: crud.get_user_by_phone(db, "0"),
+    "crud.get_user_by_email": lambda db: crud.get_user_by_email(db, "audit@example.com"),
+    "crud.get_users": lambda db: crud.get_users(db),
+    "crud.get_news": lambda db: crud.get_news(db),
+    "crud.get_news_item": lambda db: crud.get_news_item(db, 1),
+    **{
+        f"crud.get_active_products[{sort}]": (lambda sort: lambda db: crud.get_active_products(db, datetime.now(timezone.utc), sort=sort))(sort)
+        for sort in crud.PRODUCT_SORTS
+    },
+    "crud.get_active_products[price range]": lambda db: crud.get_active_products(db, datetime.now(timezone.utc), min_price=10, max_price=20, sort="price"),
+    "crud.get_active_products[name prefix]": lambda db: crud.get_active_products(db, datetime.now(timezone.utc), name_prefix="ab", sort="name"),
+    "crud.get_product": lambda db: crud.get_product(db, 1),
+    "crud.get_questions": lambda db: crud.get_questions(db),
+    "crud.get_question": lambda db: crud.get_question(db, 1),
+    "crud.get_question[created_at]": lambda db: crud.get_question(db, 1, datetime.now(timezone.utc)),
+    "question_stats.get_stats": lambda db: question_stats.get_stats(db, 1),
+    **{
+        f"question_stats.list_stats[{sort_by}]": (lambda sort_by: lambda db: question_stats.list_stats(db, sort_by=sort_by))(sort_by)
+        for sort_by in question_stats.SORT_COLUMNS
+    },
+}
+
+SCAN_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+INDEXES_SQL = """
+SELECT c.relname AS index_name, t.relname AS table_name, i.indisprimary OR i.indisunique AS is_unique
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+JOIN pg_class t ON t.oid = i.indrelid
+JOIN pg_namespace n ON n.oid = t.relnamespace
+WHERE n.nspname = current_schema()
+ORDER BY t.relname, c.relname
+"""
+
+
+def _walk(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+async def _capture(conn, run) -> list:
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    sync_engine = conn.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        async with AsyncSession(bind=conn, expire_on_commit=False) as db:
+            await run(db)
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", before_cursor_execute)
+    return captured
+
+
+async def audit(allow_seqscan: bool = False) -> int:
+    seq_scans = []
+    used = set()
+    async with database.engine.connect() as conn:
+        await conn.begin()
+        if not allow_seqscan:
+            # Small dev tables make the planner prefer seq scans even when a
+            # usable index exists; this way a seq scan means there is none.
+            await conn.execute(text("SET LOCAL enable_seqscan = off"))
+
+        for name, run in HOT_PATHS.items():
+            for statement, parameters in await _capture(conn, run):
+                result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                plan = result.scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                for node in _walk(plan[0]["Plan"]):
+                    if node["Node Type"] == "Seq Scan":
+                        seq_scans.append((name, node["Relation Name"], node.get("Filter", "")))
+                    elif node["Node Type"] in SCAN_NODES:
+                        used.add(node["Index Name"])
+
+        indexes = (await conn.execute(text(INDEXES_SQL))).all()
+        await conn.rollback()
+    await database.engine.dispose()
+
+    print("Sequential scans on hot paths:")
+    for name, table, condition in seq_scans:
+        print(f"  {name}: {table} {condition}".rstrip())
+    if not seq_scans:
+        print("  none")
+
+    print("Indexes not used by any hot path:")
+    unused = [row for row in indexes if row.index_name not in used]
+    for row in unused:
+        note = " (unique/primary key, still enforces a constraint)" if row.is_unique else ""
+        print(f"  {row.table_name}.{row.index_name}{note}")
+    if not unused:
+        print("  none")
+
+    return 1 if seq_scans else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report sequential scans and unused indexes on hot-path queries.")
+    parser.add_argument("--allow-seqscan", action="store_true", help="plan with enable_seqscan on, as production would")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(audit(args.allow_seqscan)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
+import glob
+import logging
 import os
+import time
 from dotenv import load_dotenv
-from jose import JWTError, jwt
+from jose import JWTError, jwk, jwt
+from jose.exceptions import JOSEError
 from passlib.context import CryptContext
 
 load_dotenv()
@@ -11,6 +16,18 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
+# Asymmetric signing: every <kid>.pem in JWT_KEYS_DIR verifies tokens and is
+# published in the JWKS, JWT_ACTIVE_KID picks the one that signs. Rotate by
+# adding a new key, switching JWT_ACTIVE_KID and removing the old file once
+# its tokens have expired; every worker re-reads the directory within
+# KEY_RELOAD_INTERVAL. New keys come from python -m app.jwt_keys. Without
+# JWT_KEYS_DIR tokens fall back to SECRET_KEY/ALGORITHM.
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")
+JWT_ASYMMETRIC_ALGORITHM = "ES256"
+KEY_RELOAD_INTERVAL = 60
+VERIFIED_TOKEN_CACHE_SIZE = 10000
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password, hashed_password):
@@ -28,6 +45,58 @@ from . import database, models, schemas
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Keys parsed once: kid -> private key (signing) and kid -> public key
+_signing_keys = {}
+_verifying_keys = {}
+_keys_loaded_at = 0.0
+
+# Recently verified tokens -> claims, so repeat requests skip the signature check
+_verified = OrderedDict()
+
+def load_keys():
+    global _keys_loaded_at
+    signing, verifying = {}, {}
+    for path in glob.glob(os.path.join(JWT_KEYS_DIR, "*.pem")):
+        kid = os.path.basename(path)[:-len(".pem")]
+        with open(path) as f:
+            key = jwk.construct(f.read(), JWT_ASYMMETRIC_ALGORITHM)
+        if key.is_public():
+            verifying[kid] = key
+        else:
+            signing[kid] = key
+            verifying[kid] = key.public_key()
+    if _verifying_keys.keys() - verifying.keys():
+        # Tokens signed by a removed key must stop verifying from the cache too
+        _verified.clear()
+    _signing_keys.clear()
+    _signing_keys.update(signing)
+    _verifying_keys.clear()
+    _verifying_keys.update(verifying)
+    _keys_loaded_at = time.monotonic()
+
+def _reload_if_stale():
+    # Picks up rotated-in keys and drops removed ones, whether or not this
+    # worker has seen a token signed with them yet
+    global _keys_loaded_at
+    if JWT_KEYS_DIR and time.monotonic() - _keys_loaded_at > KEY_RELOAD_INTERVAL:
+        try:
+            load_keys()
+        except (OSError, ValueError, JOSEError):
+            # A bad or half-copied file must not fail every request; keep
+            # the keys we have and try again next interval
+            logging.exception(f"Failed to reload JWT keys from {JWT_KEYS_DIR}")
+            _keys_loaded_at = time.monotonic()
+
+def jwks() -> dict:
+    _reload_if_stale()
+    keys = []
+    for kid, key in _verifying_keys.items():
+        keys.append({**key.to_dict(), "kid": kid, "use": "sig"})
+    return {"keys": keys}
+
+if JWT_KEYS_DIR:
+    load_keys()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -35,27 +104,72 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    if JWT_KEYS_DIR:
+        key = _signing_keys.get(JWT_ACTIVE_KID)
+        if key is None:
+            raise RuntimeError(f"JWT_ACTIVE_KID {JWT_ACTIVE_KID!r} has no private key in {JWT_KEYS_DIR}")
+        return jwt.encode(to_encode, key, algorithm=JWT_ASYMMETRIC_ALGORITHM, headers={"kid": JWT_ACTIVE_KID})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
+def create_user_token(user: models.User):
+    # user_id and is_admin let get_token_claims and other services authorize without a lookup
+    return create_access_token(data={"sub": user.phone_number, "user_id": user.id, "is_admin": bool(user.is_admin)})
+
+def decode_token(token: str) -> dict:
+    _reload_if_stale()
+    cached = _verified.get(token)
+    if cached is not None and cached["exp"] > time.time():
+        _verified.move_to_end(token)
+        return cached
+
+    if JWT_KEYS_DIR:
+        key = _verifying_keys.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise JWTError("Unknown signing key")
+        payload = jwt.decode(token, key, algorithms=[JWT_ASYMMETRIC_ALGORITHM])
+    else:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    _verified[token] = payload
+    if len(_verified) > VERIFIED_TOKEN_CACHE_SIZE:
+        _verified.popitem(last=False)
+    return payload
+
+async def get_token_claims(token: str = Depends(oauth2_scheme)) -> schemas.TokenData:
+    """Authenticates from the token alone, without touching the database."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         phone_number: str = payload.get("sub")
-        if phone_number is None:
+        user_id: int = payload.get("user_id")
+        if phone_number is None or user_id is None:
             raise credentials_exception
-        token_data = schemas.TokenData(phone_number=phone_number)
+        return schemas.TokenData(phone_number=phone_number, user_id=user_id, is_admin=payload.get("is_admin", False))
     except JWTError:
         raise credentials_exception
-    
-    result = await db.execute(select(models.User).options(selectinload(models.User.profile)).filter(models.User.phone_number == token_data.phone_number))
+
+async def require_admin(claims: schemas.TokenData = Depends(get_token_claims)) -> schemas.TokenData:
+    # Trusts the token's is_admin claim, so revoking admin takes effect once it expires
+    if not claims.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to perform this action"
+        )
+    return claims
+
+async def get_current_user(claims: schemas.TokenData = Depends(get_token_claims), db: AsyncSession = database.db_session):
+    result = await db.execute(select(models.User).options(selectinload(models.User.profile)).filter(models.User.id == claims.user_id))
     user = result.scalars().first()
     
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
@@ -1,7 +1,12 @@
+import base64
+import binascii
+import json
+import time
+from sqlalchemy import collate, literal, tuple_
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from app import models
 
 async def get_user_by_phone(db: AsyncSession, phone_number: str):
@@ -12,6 +17,33 @@ async def get_user_by_email(db: AsyncSession, email: str):
     result = await db.execute(select(models.User).options(selectinload(models.User.profile)).filter(models.User.email == email))
     return result.scalars().first()
 
+# news and questions are partitioned by month on created_at; newest-first
+# listings look at this window first so the planner prunes to the newest
+# few partitions, and only widen to the whole table when it runs short
+RECENT_WINDOW = timedelta(days=92)
+# model -> (offset the window was last seen to end by, when), so pages past
+# it go straight to the whole table instead of trying the window first. A
+# stale entry only costs an unpruned query, never a wrong page.
+_window_ends: dict = {}
+WINDOW_END_TTL = 60
+
+async def _recent_first(db: AsyncSession, model, skip: int, limit: int):
+    query = select(model).order_by(model.created_at.desc()).offset(skip).limit(limit)
+    known = _window_ends.get(model)
+    if known is None or skip < known[0] or time.monotonic() - known[1] > WINDOW_END_TTL:
+        cutoff = datetime.now(timezone.utc) - RECENT_WINDOW
+        result = await db.execute(query.filter(model.created_at >= cutoff))
+        rows = result.scalars().all()
+        if len(rows) == limit:
+            return rows
+        _window_ends[model] = (skip + len(rows), time.monotonic())
+    result = await db.execute(query)
+    return result.scalars().all()
+
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 10):
+    result = await db.execute(select(models.User).options(selectinload(models.User.profile)).order_by(models.User.id).offset(skip).limit(limit))
+    return result.scalars().all()
+
 async def create_news(db: AsyncSession, news: models.News):
     db.add(news)
     await db.commit()
@@ -19,8 +51,13 @@ async def create_news(db: AsyncSession, news: models.News):
     return news
 
 async def get_news(db: AsyncSession, skip: int = 0, limit: int = 10):
-    result = await db.execute(select(models.News).offset(skip).limit(limit).order_by(models.News.created_at.desc()))
-    return result.scalars().all()
+    return await _recent_first(db, models.News, skip, limit)
+
+async def get_news_item(db: AsyncSession, news_id: int):
+    # Probes every monthly partition's primary key; only the admin image
+    # upload looks news up by id
+    result = await db.execute(select(models.News).filter(models.News.id == news_id))
+    return result.scalars().first()
 
 async def create_product(db: AsyncSession, product: models.Product):
     db.add(product)
@@ -28,15 +65,105 @@ async def create_product(db: AsyncSession, product: models.Product):
     await db.refresh(product)
     return product
 
-async def get_active_products(db: AsyncSession, now: datetime, skip: int = 0, limit: int = 10):
-    result = await db.execute(
-        select(models.Product)
-        .filter(models.Product.publish_at <= now)
-        .offset(skip)
-        .limit(limit)
+# Sort keys for the product catalogue; each one has a matching (key, id)
+# index so filtered listings are a single index range scan
+PRODUCT_NAME_C = collate(models.Product.name, "C")
+PRODUCT_SORTS = {
+    "price": models.Product.price,
+    "publish_at": models.Product.publish_at,
+    "name": PRODUCT_NAME_C,
+}
+
+def encode_product_cursor(product: models.Product, sort: str) -> str:
+    value = getattr(product, "name" if sort == "name" else sort)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, product.id]).encode()).decode()
+
+MAX_PRODUCT_ID = 2**31 - 1
+
+def decode_product_cursor(cursor: str, sort: str):
+    """Returns the (sort value, id) pair to continue after, or raises ValueError."""
+    try:
+        value, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort == "publish_at":
+            value = datetime.fromisoformat(value)
+        elif sort == "price":
+            value = float(value)
+        elif not isinstance(value, str) or "\x00" in value:
+            raise ValueError("name cursor must be a string")
+        product_id = int(product_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError("Invalid cursor") from e
+    # Anything outside the column's range would fail in the driver instead
+    if not 0 < product_id <= MAX_PRODUCT_ID:
+        raise ValueError("Invalid cursor")
+    return value, product_id
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """Smallest string above everything starting with `prefix`, or None if nothing is."""
+    while prefix:
+        code = ord(prefix[-1]) + 1
+        if code == 0xD800:
+            # Surrogates cannot be encoded; the next real character follows them
+            code = 0xE000
+        if code <= 0x10FFFF:
+            return prefix[:-1] + chr(code)
+        # U+10FFFF cannot be incremented, so bound on the shorter prefix
+        prefix = prefix[:-1]
+    return None
+
+async def get_active_products(
+    db: AsyncSession,
+    now: datetime,
+    skip: int = 0,
+    limit: int = 10,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    name_prefix: str | None = None,
+    sort: str = "publish_at",
+    descending: bool = False,
+    after: tuple | None = None,
+):
+    column = PRODUCT_SORTS[sort]
+    # Products without a name or price are left out: schemas.Product cannot
+    # represent them, and a NULL sort key would break the keyset comparison
+    # and the cursor. publish_at <= now already excludes a NULL publish_at.
+    query = select(models.Product).filter(
+        models.Product.publish_at <= now,
+        models.Product.name.isnot(None),
+        models.Product.price.isnot(None),
     )
+
+    if min_price is not None:
+        query = query.filter(models.Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(models.Product.price <= max_price)
+    if name_prefix:
+        # A plain range under the "C" collation, so ix_products_name_c_id
+        # serves both the prefix match and the name ordering
+        query = query.filter(PRODUCT_NAME_C >= name_prefix)
+        upper = _prefix_upper_bound(name_prefix)
+        if upper is not None:
+            query = query.filter(PRODUCT_NAME_C < upper)
+
+    if after is not None:
+        key = tuple_(column, models.Product.id)
+        bound = tuple_(literal(after[0], column.type), literal(after[1]))
+        query = query.filter(key < bound if descending else key > bound)
+
+    if descending:
+        query = query.order_by(column.desc(), models.Product.id.desc())
+    else:
+        query = query.order_by(column.asc(), models.Product.id.asc())
+
+    result = await db.execute(query.offset(skip).limit(limit))
     return result.scalars().all()
 
+async def get_product(db: AsyncSession, product_id: int):
+    result = await db.execute(select(models.Product).filter(models.Product.id == product_id))
+    return result.scalars().first()
+
 async def create_question(db: AsyncSession, question: models.Question):
     db.add(question)
     await db.commit()
@@ -44,9 +171,12 @@ async def create_question(db: AsyncSession, question: models.Question):
     return question
 
 async def get_questions(db: AsyncSession, skip: int = 0, limit: int = 10):
-    result = await db.execute(select(models.Question).offset(skip).limit(limit).order_by(models.Question.created_at.desc()))
-    return result.scalars().all()
+    return await _recent_first(db, models.Question, skip, limit)
 
-async def get_question(db: AsyncSession, question_id: int):
-    result = await db.execute(select(models.Question).filter(models.Question.id == question_id))
+async def get_question(db: AsyncSession, question_id: int, created_at: datetime | None = None):
+    query = select(models.Question).filter(models.Question.id == question_id)
+    if created_at is not None:
+        # Prunes the lookup to one partition; by id alone it probes every month
+        query = query.filter(models.Question.created_at == created_at)
+    result = await db.execute(query)
     return result.scalars().first()
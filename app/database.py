@@ -1,3 +1,4 @@
+from fastapi import Depends
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 
@@ -7,8 +8,19 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+# Seconds to wait for a free connection; kept close to the admission lane
+# deadlines so a request cannot queue here much longer than it would there
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 3))
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -19,5 +31,17 @@ AsyncSessionLocal = sessionmaker(
 Base = declarative_base()
 
 async def get_db():
+    """
+    Yields one AsyncSession per request.
+
+    The session only checks a connection out of the pool on its first
+    execute and hands it back on commit, so handlers that bail out early
+    never touch the pool at all.
+    """
     async with AsyncSessionLocal() as session:
         yield session
+
+# Shared by get_current_user and the path functions so both resolve to the
+# same cached session, and closed as soon as the path function returns
+# instead of after the response has been sent to the client.
+db_session = Depends(get_db, scope="function")
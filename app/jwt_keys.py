@@ -0,0 +1,58 @@
+"""
+Generates ES256 signing keys for app.auth.
+
+Writes <kid>.pem into JWT_KEYS_DIR; point JWT_ACTIVE_KID at it to start
+signing with it. Kept apart from app.auth so it runs without the database
+settings.
+
+    python -m app.jwt_keys <kid>
+"""
+import argparse
+import os
+import tempfile
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR")
+
+
+def generate_key(kid: str, directory: str) -> str:
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kid}.pem")
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    # Workers re-read the directory on a timer, so the key only appears
+    # under its .pem name once it is complete
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{kid}.", suffix=".tmp")
+    try:
+        with open(fd, "wb") as f:
+            f.write(pem)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a new ES256 signing key in JWT_KEYS_DIR.")
+    parser.add_argument("kid", help="key id, also the file name")
+    args = parser.parse_args()
+    if not JWT_KEYS_DIR:
+        parser.error("JWT_KEYS_DIR is not set")
+    try:
+        print(generate_key(args.kid, JWT_KEYS_DIR))
+    except FileExistsError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
-from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Literal
+from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks, UploadFile, Request, Response
+from fastapi.responses import JSONResponse
+import sqlalchemy.exc
 from sqlalchemy.ext.asyncio import AsyncSession
-from app import models, schemas, auth, database, crud, email_util
+from starlette.concurrency import run_in_threadpool
+from app import models, schemas, auth, database, crud, email_util, admission, question_pool, question_stats, profiling, media, partitions
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,18 +23,56 @@ def log_product_creation(product_name: str):
     logging.info(f"New product created: {product_name}")
 
 
-
-
-app = FastAPI(title="Come On Da Sample")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with database.AsyncSessionLocal() as db:
+        await question_pool.load(db)
+    flushers = [
+        asyncio.create_task(question_pool.run_flusher()),
+        asyncio.create_task(question_stats.run_flusher()),
+        asyncio.create_task(partitions.run_maintainer()),
+    ]
+    yield
+    for flusher in flushers:
+        flusher.cancel()
+    # Let a flush interrupted mid-write put its batch back before the final one
+    await asyncio.gather(*flushers, return_exceptions=True)
+    await question_pool.flush()
+    await question_stats.flush()
+    media.shutdown()
+
+
+app = FastAPI(title="Come On Da Sample", lifespan=lifespan)
+app.add_middleware(media.UploadLimitMiddleware)
+if profiling.PROFILE_SECRET:
+    app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(admission.AdmissionMiddleware)
+
+@app.exception_handler(sqlalchemy.exc.TimeoutError)
+async def pool_timeout_handler(request: Request, exc: sqlalchemy.exc.TimeoutError):
+    # No connection freed up within DB_POOL_TIMEOUT: shed like admission does
+    logging.warning("Timed out waiting for a database connection")
+    return JSONResponse(status_code=503, content={"detail": "Server is busy, please retry later"}, headers={"Retry-After": "1"})
 
 @app.get("/")
 async def root():
     return {"message": "Come On Da API is running", "docs": "/docs"}
 
+@app.get("/.well-known/jwks.json")
+async def read_jwks(response: Response):
+    # Public keys for verifying our access tokens without calling this service
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return auth.jwks()
+
+@app.get("/metrics/admission")
+async def admission_metrics(claims: schemas.TokenData = Depends(auth.require_admin)):
+    # Queue depth and shed counters per route class
+    return admission.stats()
+
 
 
 @app.post("/signup", response_model=schemas.Token)
-async def signup(user: schemas.UserCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(database.get_db)):
+async def signup(user: schemas.UserCreate, background_tasks: BackgroundTasks, db: AsyncSession = database.db_session):
     # Check if phone number already exists
     db_user = await crud.get_user_by_phone(db, user.phone_number)
     if db_user:
@@ -41,8 +83,11 @@ async def signup(user: schemas.UserCreate, background_tasks: BackgroundTasks, db
     if db_user_email:
         raise HTTPException(status_code=400, detail="Email already registered")
 
+    # Hand the connection back to the pool while bcrypt runs off the event loop
+    await db.close()
+
     # Create new user
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await run_in_threadpool(auth.get_password_hash, user.password)
     new_user = models.User(
         username=user.username,
         email=user.email,
@@ -57,40 +102,42 @@ async def signup(user: schemas.UserCreate, background_tasks: BackgroundTasks, db
     background_tasks.add_task(email_util.send_welcome_email, new_user.email, new_user.username)
 
     # Return access token
-    access_token = auth.create_access_token(data={"sub": new_user.phone_number})
+    access_token = auth.create_user_token(new_user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 from fastapi.security import OAuth2PasswordRequestForm
 
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = database.db_session):
     # Swagger UI sends 'username' and 'password' as form data
     # We map 'username' to 'phone_number'
     user = await crud.get_user_by_phone(db, form_data.username)
+    await db.close()
 
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
-    if not auth.verify_password(form_data.password, user.hashed_password):
+    if not await run_in_threadpool(auth.verify_password, form_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
-    access_token = auth.create_access_token(data={"sub": user.phone_number})
+    access_token = auth.create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/login", response_model=schemas.Token)
-async def login(user_credentials: schemas.UserLogin, db: AsyncSession = Depends(database.get_db)):
+async def login(user_credentials: schemas.UserLogin, db: AsyncSession = database.db_session):
     # Find user by phone number
     user = await crud.get_user_by_phone(db, user_credentials.phone_number)
+    await db.close()
 
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
     # Verify password
-    if not auth.verify_password(user_credentials.password, user.hashed_password):
+    if not await run_in_threadpool(auth.verify_password, user_credentials.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
     # Generate token
-    access_token = auth.create_access_token(data={"sub": user.phone_number})
+    access_token = auth.create_user_token(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/me", response_model=schemas.User)
@@ -100,7 +147,7 @@ async def read_users_me(current_user: models.User = Depends(auth.get_current_use
 @app.post("/users/me/profile", response_model=schemas.UserProfile)
 async def create_update_profile(
     profile: schemas.UserProfileCreate,
-    db: AsyncSession = Depends(database.get_db),
+    db: AsyncSession = database.db_session,
     current_user: models.User = Depends(auth.get_current_user)
 ):
     if current_user.profile:
@@ -118,31 +165,43 @@ async def create_update_profile(
         return new_profile
 
 @app.get("/users", response_model=list[schemas.User])
-async def read_users(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    result = await db.execute(select(models.User).options(selectinload(models.User.profile)).offset(skip).limit(limit))
-    return result.scalars().all()
+async def read_users(skip: int = 0, limit: int = 10, db: AsyncSession = database.db_session, claims: schemas.TokenData = Depends(auth.get_token_claims)):
+    return await crud.get_users(db, skip=skip, limit=limit)
 
 # News Endpoints
 @app.post("/news", response_model=schemas.News)
 async def create_news(
     news: schemas.NewsCreate, 
-    db: AsyncSession = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = database.db_session,
+    claims: schemas.TokenData = Depends(auth.require_admin)
 ):
-    if not current_user.is_admin:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, 
-            detail="You do not have permission to perform this action"
-        )
-    
     new_news = models.News(**news.model_dump())
     new_news = await crud.create_news(db, new_news)
     return new_news
 
 @app.get("/news", response_model=list[schemas.News])
-async def read_news(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(database.get_db)):
+async def read_news(skip: int = 0, limit: int = 10, db: AsyncSession = database.db_session):
     return await crud.get_news(db, skip=skip, limit=limit)
 
+@app.post("/news/{news_id}/image", response_model=schemas.ImageUpload)
+async def upload_news_image(
+    news_id: int,
+    file: UploadFile,
+    db: AsyncSession = database.db_session,
+    claims: schemas.TokenData = Depends(auth.require_admin)
+):
+    news = await crud.get_news_item(db, news_id)
+    if not news:
+        raise HTTPException(status_code=404, detail="News not found")
+    # Don't hold a connection while the image is resized
+    await db.close()
+
+    digest = await media.store_image(file)
+    news.image_url = media.url_for(digest)
+    db.add(news)
+    await db.commit()
+    return {"image_url": news.image_url, "variants": media.variant_urls(digest)}
+
 
 
 # Product Endpoints
@@ -153,15 +212,9 @@ from datetime import datetime, timezone
 async def create_product(
     product: schemas.ProductCreate, 
     background_tasks: BackgroundTasks,
-    db: AsyncSession = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = database.db_session,
+    claims: schemas.TokenData = Depends(auth.require_admin)
 ):
-    if not current_user.is_admin:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, 
-            detail="You do not have permission to perform this action"
-        )
-    
     # Set default publish_at to now if not provided
     if product.publish_at is None:
         product.publish_at = datetime.now(timezone.utc)
@@ -175,46 +228,128 @@ async def create_product(
     return new_product
 
 @app.get("/products", response_model=list[schemas.Product])
-async def read_products(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(database.get_db)):
+async def read_products(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    name_prefix: str | None = None,
+    sort: Literal["price", "publish_at", "name"] = "publish_at",
+    order: Literal["asc", "desc"] = "asc",
+    cursor: str | None = None,
+    db: AsyncSession = database.db_session
+):
     now = datetime.now(timezone.utc)
+    if name_prefix and "\x00" in name_prefix:
+        raise HTTPException(status_code=400, detail="Invalid name_prefix")
+    after = None
+    if cursor:
+        try:
+            after = crud.decode_product_cursor(cursor, sort)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
     # Only show products where publish_at <= now
-    return await crud.get_active_products(db, now, skip=skip, limit=limit)
+    products = await crud.get_active_products(
+        db, now, skip=skip, limit=limit,
+        min_price=min_price, max_price=max_price, name_prefix=name_prefix,
+        sort=sort, descending=order == "desc", after=after,
+    )
+    # Pass X-Next-Cursor back as ?cursor= to fetch the next page
+    if products and len(products) == limit:
+        response.headers["X-Next-Cursor"] = crud.encode_product_cursor(products[-1], sort)
+    return products
+
+@app.post("/products/{product_id}/image", response_model=schemas.ImageUpload)
+async def upload_product_image(
+    product_id: int,
+    file: UploadFile,
+    db: AsyncSession = database.db_session,
+    claims: schemas.TokenData = Depends(auth.require_admin)
+):
+    product = await crud.get_product(db, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    # Don't hold a connection while the image is resized
+    await db.close()
+
+    digest = await media.store_image(file)
+    product.image_url = media.url_for(digest)
+    db.add(product)
+    await db.commit()
+    return {"image_url": product.image_url, "variants": media.variant_urls(digest)}
+
+# Media Endpoints
+@app.get("/media/{digest}/{name}")
+async def read_media(digest: str, name: str):
+    return media.serve(digest, name)
 
 # Question Endpoints
 @app.post("/questions", response_model=schemas.Question)
 async def create_question(
     question: schemas.QuestionCreate, 
-    db: AsyncSession = Depends(database.get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = database.db_session,
+    claims: schemas.TokenData = Depends(auth.require_admin)
 ):
-    if not current_user.is_admin:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN, 
-            detail="You do not have permission to perform this action"
-        )
-    
     new_question = models.Question(**question.model_dump())
     new_question = await crud.create_question(db, new_question)
+    question_pool.add(new_question.id, new_question.created_at)
     return new_question
 
 @app.get("/questions", response_model=list[schemas.QuestionPublic])
-async def read_questions(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+async def read_questions(skip: int = 0, limit: int = 10, db: AsyncSession = database.db_session, claims: schemas.TokenData = Depends(auth.get_token_claims)):
 
     # Assuming questions are visible to all authenticated users
     return await crud.get_questions(db, skip=skip, limit=limit)
 
+@app.get("/questions/next", response_model=schemas.QuestionPublic)
+async def read_next_question(db: AsyncSession = database.db_session, claims: schemas.TokenData = Depends(auth.get_token_claims)):
+    # Random question the user has not answered yet, picked from memory
+    while (question_id := await question_pool.next_unseen(db, claims.user_id)) is not None:
+        question = await crud.get_question(db, question_id, question_pool.created_at(question_id))
+        if question:
+            return question
+        # Archived along with its month's partition
+        question_pool.discard(question_id)
+    raise HTTPException(status_code=404, detail="No unanswered questions left")
+
+@app.get("/questions/stats", response_model=list[schemas.QuestionStats])
+async def read_questions_stats(
+    sort_by: Literal["attempts", "correct", "distinct_users", "accuracy"] = "attempts",
+    order: Literal["asc", "desc"] = "desc",
+    skip: int = 0,
+    limit: int = 10,
+    db: AsyncSession = database.db_session,
+    claims: schemas.TokenData = Depends(auth.require_admin)
+):
+    return await question_stats.list_stats(db, sort_by=sort_by, descending=order == "desc", skip=skip, limit=limit)
+
+@app.get("/questions/{question_id}/stats", response_model=schemas.QuestionStats)
+async def read_question_stats(
+    question_id: int,
+    db: AsyncSession = database.db_session,
+    claims: schemas.TokenData = Depends(auth.require_admin)
+):
+    stats = await question_stats.get_stats(db, question_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No answers recorded for this question")
+    return stats
+
 @app.post("/questions/{question_id}/check", response_model=schemas.AnswerResult)
 async def check_answer(
     question_id: int,
     answer_check: schemas.AnswerCheck,
-    db: AsyncSession = Depends(database.get_db),
+    db: AsyncSession = database.db_session,
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    question = await crud.get_question(db, question_id)
+    question = await crud.get_question(db, question_id, question_pool.created_at(question_id))
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
     
     is_correct = question.answer.strip().lower() == answer_check.answer.strip().lower()
+    first_attempt = await question_pool.mark_seen(db, current_user.id, question_id)
+    question_stats.record(question_id, is_correct, first_attempt)
     
     if is_correct:
         # Prize distribution logic
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+
+load_dotenv()
+
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+MEDIA_URL = "/media"
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", 2))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+# Room for the multipart boundaries and headers around the image itself
+MULTIPART_OVERHEAD = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Variants are rendered once at upload time; clients pick the size they need
+VARIANTS = {"thumb": (200, 200), "medium": (800, 800)}
+FORMATS = {"webp": "image/webp", "jpg": "image/jpeg"}
+SAVE_OPTIONS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpg": {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True},
+}
+DEFAULT_VARIANT = "medium.jpg"
+
+# Content-hashed URLs never change meaning, so clients and CDNs may keep them forever
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+_pool: ProcessPoolExecutor | None = None
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # The server already runs threads by now, and forking a threaded
+        # process can deadlock the child
+        _pool = ProcessPoolExecutor(max_workers=MEDIA_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _directory(digest: str) -> str:
+    return os.path.join(MEDIA_ROOT, digest[:2], digest)
+
+
+def url_for(digest: str, name: str = DEFAULT_VARIANT) -> str:
+    return f"{MEDIA_URL}/{digest}/{name}"
+
+
+def variant_urls(digest: str) -> dict[str, str]:
+    return {f"{variant}.{ext}": url_for(digest, f"{variant}.{ext}") for variant in VARIANTS for ext in FORMATS}
+
+
+def _render_variants(source: str, target: str) -> bool:
+    """Runs in a worker process: writes every variant of `source` into `target`."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        return False
+
+    # Render into a scratch directory and rename it into place, so a
+    # directory that exists under its digest is always complete. The parent
+    # is only created once the upload is known to be an image.
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    scratch = tempfile.mkdtemp(dir=os.path.dirname(target))
+    try:
+        for variant, size in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.Resampling.LANCZOS)
+            for ext, options in SAVE_OPTIONS.items():
+                resized.save(os.path.join(scratch, f"{variant}.{ext}"), **options)
+        try:
+            os.rename(scratch, target)
+        except OSError:
+            # Same image uploaded concurrently; the other render won
+            pass
+    finally:
+        # Gone after a successful rename; otherwise drop the partial render
+        shutil.rmtree(scratch, ignore_errors=True)
+    return True
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware that caps image upload bodies at MAX_UPLOAD_BYTES (plus
+    the multipart envelope) while they are received, before Starlette
+    spools the whole form to disk. Content-Length is checked up front;
+    chunked bodies are counted as they arrive.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].rstrip("/").endswith("/image"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            await _reject_too_large(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def _reject_too_large(send):
+    body = json.dumps({"detail": "Image is too large"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"connection", b"close"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _spool(upload: UploadFile) -> tuple[str, str]:
+    """
+    Streams the upload to a temporary file in chunks and returns (path,
+    sha256). The size check here is exact for the image part alone.
+    """
+    os.makedirs(os.path.join(MEDIA_ROOT, "tmp"), exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=os.path.join(MEDIA_ROOT, "tmp"))
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large")
+                digest.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, digest.hexdigest()
+
+
+async def store_image(upload: UploadFile) -> str:
+    """Saves an uploaded image and its variants, returning its content digest."""
+    path, digest = await _spool(upload)
+    try:
+        target = _directory(digest)
+        if os.path.isdir(target):
+            return digest
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(_executor(), _render_variants, path, target):
+            raise HTTPException(status_code=400, detail="File is not a supported image")
+        return digest
+    finally:
+        os.unlink(path)
+
+
+def serve(digest: str, name: str) -> FileResponse:
+    variant, _, ext = name.partition(".")
+    if not _DIGEST.match(digest) or variant not in VARIANTS or ext not in FORMATS:
+        raise HTTPException(status_code=404, detail="Image not found")
+    path = os.path.join(_directory(digest), name)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type=FORMATS[ext], headers={"Cache-Control": CACHE_CONTROL})
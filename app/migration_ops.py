@@ -0,0 +1,37 @@
+"""
+Index operations for Alembic revisions that must not lock tables.
+
+CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction, so each
+helper commits the migration's transaction so far, runs the statement in
+autocommit mode and then resumes. Keep these at the end of a revision's
+upgrade()/downgrade() so earlier DDL is not committed half way.
+"""
+from alembic import context, op
+from sqlalchemy import text
+
+
+def _drop_invalid(index_name: str):
+    # A failed CONCURRENTLY build leaves an INVALID index behind that
+    # IF NOT EXISTS would happily skip over.
+    if context.is_offline_mode():
+        return
+    invalid = op.get_bind().execute(
+        text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ),
+        {"name": index_name},
+    ).first()
+    if invalid:
+        op.drop_index(index_name, postgresql_concurrently=True, if_exists=True)
+
+
+def create_index_concurrently(index_name: str, table_name: str, columns: list, **kw):
+    with op.get_context().autocommit_block():
+        _drop_invalid(index_name)
+        op.create_index(index_name, table_name, columns, postgresql_concurrently=True, if_not_exists=True, **kw)
+
+
+def drop_index_concurrently(index_name: str, table_name: str):
+    with op.get_context().autocommit_block():
+        op.drop_index(index_name, table_name=table_name, postgresql_concurrently=True, if_exists=True)
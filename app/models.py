@@ -1,4 +1,7 @@
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey
+from sqlalchemy import Index, cast, collate, literal_column
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -6,7 +9,7 @@ from .database import Base
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     username = Column(String, index=True)
     phone_number = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
@@ -18,7 +21,7 @@ class User(Base):
 class UserProfile(Base):
     __tablename__ = "user_profiles"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True)
     address = Column(String, nullable=True)
     wins = Column(Integer, default=0)
@@ -30,17 +33,19 @@ class UserProfile(Base):
 
 class News(Base):
     __tablename__ = "news"
+    # Monthly partitions are managed by app.partitions
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String, index=True)
     content = Column(String)
     image_url = Column(String, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), primary_key=True, index=True)
 
 class Product(Base):
     __tablename__ = "products"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String, index=True)
     description = Column(String)
     price = Column(Float)
@@ -49,8 +54,57 @@ class Product(Base):
 
 class Question(Base):
     __tablename__ = "questions"
+    # Monthly partitions are managed by app.partitions
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     text = Column(String, index=True)
     answer = Column(String)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), primary_key=True, index=True)
+
+class QuestionSeen(Base):
+    __tablename__ = "question_seen"
+
+    # Bit n of bitmap is set once the user has answered question
+    # chunk * question_pool.CHUNK_BITS + n
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    chunk = Column(Integer, primary_key=True)
+    bitmap = Column(BIT(varying=True), nullable=False, default=b"")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class QuestionStats(Base):
+    __tablename__ = "question_stats"
+
+    # No foreign key: questions is partitioned and archived month by month
+    question_id = Column(Integer, primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+    distinct_users = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    @hybrid_property
+    def accuracy(self):
+        return self.correct / self.attempts if self.attempts else None
+
+    @accuracy.inplace.expression
+    @classmethod
+    def _accuracy_expression(cls):
+        # Must match ix_question_stats_accuracy exactly for the index to be used
+        return cast(cls.correct, Float) / func.nullif(cls.attempts, literal_column("0"), type_=Float)
+
+
+# One index per sortable column of GET /questions/stats, with question_id as
+# the tie-breaker so the listing is a single index scan in either direction
+Index("ix_question_stats_attempts", QuestionStats.attempts, QuestionStats.question_id)
+Index("ix_question_stats_correct", QuestionStats.correct, QuestionStats.question_id)
+Index("ix_question_stats_distinct_users", QuestionStats.distinct_users, QuestionStats.question_id)
+Index("ix_question_stats_accuracy", QuestionStats.accuracy, QuestionStats.question_id)
+
+# Product catalogue listings (crud.get_active_products). Each sort key leads
+# its index with id as the keyset tie-breaker, so a page is one range scan in
+# index order that stops after `limit` matching rows; the other filters are
+# checked on the fetched rows. Names are indexed under the "C" collation so
+# one btree serves both name prefix ranges and ORDER BY name.
+Index("ix_products_publish_at_id", Product.publish_at, Product.id)
+Index("ix_products_price_id", Product.price, Product.id)
+Index("ix_products_name_c_id", collate(Product.name, "C"), Product.id)
@@ -0,0 +1,153 @@
+"""
+Monthly range partitions on created_at for the news and questions tables.
+
+ensure_partitions() keeps PARTITION_MONTHS_AHEAD months of empty partitions
+ready ahead of time (the app runs it at startup and daily, retrying within
+minutes while any is missing); rows that still land outside them go to the
+<table>_default partition. archive() exports whole months to gzipped CSV
+under ARCHIVE_DIR and drops them.
+
+    python -m app.partitions ensure
+    python -m app.partitions archive --before 2025-01
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import re
+import sys
+from datetime import date, datetime, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from app import database
+
+load_dotenv()
+
+PARTITIONED_TABLES = ("news", "questions")
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+MAINTENANCE_INTERVAL = 24 * 60 * 60
+# Until every upcoming partition exists, try again this often
+MAINTENANCE_RETRY_INTERVAL = 5 * 60
+
+_PARTITION_NAME = re.compile(r"_p(\d{4})_(\d{2})$")
+
+PARTITIONS_SQL = """
+SELECT c.relname
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+JOIN pg_class p ON p.oid = i.inhparent
+WHERE p.relname = :table
+ORDER BY c.relname
+"""
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_ddl(table: str, month: date) -> str:
+    """CREATE statement for the partition holding `month`; also used by the migrations."""
+    upper = add_months(month, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+    )
+
+
+def current_month() -> date:
+    return datetime.now(timezone.utc).date().replace(day=1)
+
+
+async def ensure_partitions(months_ahead: int = PARTITION_MONTHS_AHEAD) -> list[str]:
+    """
+    Creates the missing partitions for this month and the next
+    `months_ahead`, each in its own transaction so one failure does not undo
+    the rest. Returns the names of the partitions that could not be created.
+    """
+    months = [add_months(current_month(), offset) for offset in range(months_ahead + 1)]
+    failed = []
+    for table in PARTITIONED_TABLES:
+        for month in months:
+            try:
+                async with database.engine.begin() as conn:
+                    await conn.execute(text(partition_ddl(table, month)))
+            except Exception:
+                # Another worker may be creating the same partition, or rows
+                # for the month already sit in <table>_default
+                logging.exception(f"Failed to create partition {partition_name(table, month)}")
+                failed.append(partition_name(table, month))
+    return failed
+
+
+async def run_maintainer():
+    while True:
+        failed = await ensure_partitions()
+        await asyncio.sleep(MAINTENANCE_RETRY_INTERVAL if failed else MAINTENANCE_INTERVAL)
+
+
+async def archive(before: date, directory: str = ARCHIVE_DIR) -> list[str]:
+    """
+    Exports every monthly partition that ends on or before `before` to
+    <directory>/<partition>.csv.gz, then detaches and drops it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    archived = []
+    async with database.engine.connect() as conn:
+        for table in PARTITIONED_TABLES:
+            partitions = (await conn.execute(text(PARTITIONS_SQL), {"table": table})).scalars().all()
+            await conn.rollback()
+            for partition in partitions:
+                match = _PARTITION_NAME.search(partition)
+                if not match:
+                    continue
+                month = date(int(match.group(1)), int(match.group(2)), 1)
+                if add_months(month, 1) > before:
+                    continue
+
+                path = os.path.join(directory, f"{partition}.csv.gz")
+                raw = await conn.get_raw_connection()
+                # Old months take no more writes, so exporting before the
+                # detach cannot miss rows
+                with gzip.open(path + ".part", "wb") as f:
+                    await raw.driver_connection.copy_from_table(partition, output=f, format="csv", header=True)
+                os.replace(path + ".part", path)
+
+                async with conn.begin():
+                    await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+                    await conn.execute(text(f"DROP TABLE {partition}"))
+                logging.info(f"Archived {partition} to {path}")
+                archived.append(path)
+    await database.engine.dispose()
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the monthly news/questions partitions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="create partitions for the coming months")
+    ensure.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    archive_cmd = commands.add_parser("archive", help="export and drop old partitions")
+    archive_cmd.add_argument("--before", required=True, help="first month to keep, as YYYY-MM")
+    archive_cmd.add_argument("--dir", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        if asyncio.run(ensure_partitions(args.months_ahead)):
+            sys.exit(1)
+    else:
+        before = datetime.strptime(args.before, "%Y-%m").date()
+        for path in asyncio.run(archive(before, args.dir)):
+            print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+from app import database
+
+load_dotenv()
+
+# Profiling is only wired into the app when PROFILE_SECRET is set, so
+# deployments without it pay nothing at all.
+PROFILE_SECRET = os.getenv("PROFILE_SECRET")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.001))
+PROFILE_MAX_PER_MINUTE = int(os.getenv("PROFILE_MAX_PER_MINUTE", 6))
+
+HEADER = b"x-profile"
+QUERY_PARAM = b"__profile="
+
+_statements = contextvars.ContextVar("profiled_statements", default=None)
+
+
+def sign(path: str, ttl: int = 300) -> str:
+    """Token that enables profiling of `path` until it expires."""
+    expires = int(time.time()) + ttl
+    return f"{expires}.{_signature(path, expires)}"
+
+
+def _signature(path: str, expires: int) -> str:
+    message = f"{expires}:{path}".encode()
+    return hmac.new(PROFILE_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify(path: str, token: str) -> bool:
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, _signature(path, int(expires)))
+
+
+def _token(scope) -> str | None:
+    for name, value in scope["headers"]:
+        if name == HEADER:
+            return value.decode("latin-1")
+    query = scope["query_string"]
+    if QUERY_PARAM in query:
+        for pair in query.split(b"&"):
+            if pair.startswith(QUERY_PARAM):
+                return pair[len(QUERY_PARAM):].decode("latin-1")
+    return None
+
+
+class _Sampler(threading.Thread):
+    """
+    Samples the event loop thread's Python stack, keeping only samples
+    taken while the profiled request's task is the one running. Time the
+    task spends awaiting the database shows up in the SQL log instead.
+    """
+
+    def __init__(self, loop, task):
+        super().__init__(daemon=True)
+        self.loop = loop
+        self.task = task
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(PROFILE_INTERVAL):
+            if asyncio.current_task(self.loop) is not self.task:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _statements.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements = _statements.get()
+    if statements is None:
+        return
+    started = conn.info["profile_started"].pop()
+    statements.append({"statement": statement, "ms": round((time.perf_counter() - started) * 1000, 3)})
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when it carries a valid signed token in the
+    X-Profile header or the __profile query parameter.
+
+    Writes a collapsed-stack file (flamegraph.pl / speedscope) and the SQL
+    statements with their timings to PROFILE_DIR. Only one request is
+    profiled at a time and at most PROFILE_MAX_PER_MINUTE per minute;
+    requests over the limit are served normally.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = False
+        self._window = 0
+        self._count = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _token(scope)
+        if token is None or not verify(scope["path"], token) or not self._admit():
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self._profile(scope, receive, send)
+        finally:
+            self._busy = False
+
+    def _admit(self) -> bool:
+        minute = int(time.time() // 60)
+        if minute != self._window:
+            self._window = minute
+            self._count = 0
+        if self._busy or self._count >= PROFILE_MAX_PER_MINUTE:
+            return False
+        self._busy = True
+        self._count += 1
+        return True
+
+    async def _profile(self, scope, receive, send):
+        sync_engine = database.engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+        statements = []
+        reset = _statements.set(statements)
+        sampler = _Sampler(asyncio.get_running_loop(), asyncio.current_task())
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - started
+            _statements.reset(reset)
+            event.remove(sync_engine, "before_cursor_execute", _before_cursor_execute)
+            event.remove(sync_engine, "after_cursor_execute", _after_cursor_execute)
+            await asyncio.to_thread(_write, scope, sampler.stacks, statements, elapsed)
+
+
+def _write(scope, stacks: Counter, statements: list, elapsed: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+    base = os.path.join(PROFILE_DIR, f"{stamp}-{scope['method']}-{slug}")
+
+    with open(base + ".folded", "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    with open(base + ".sql.json", "w") as f:
+        json.dump({
+            "method": scope["method"],
+            "path": scope["path"],
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "sql_ms": round(sum(s["ms"] for s in statements), 3),
+            "samples": sum(stacks.values()),
+            "sample_interval_ms": PROFILE_INTERVAL * 1000,
+            "statements": statements,
+        }, f, indent=2)
+
+    logging.info(f"Profile written to {base}.folded")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mint a token that profiles requests to a path.")
+    parser.add_argument("path", help="request path, e.g. /users")
+    parser.add_argument("--ttl", type=int, default=300, help="seconds the token stays valid")
+    args = parser.parse_args()
+    if not PROFILE_SECRET:
+        parser.error("PROFILE_SECRET is not set")
+    print(sign(args.path, args.ttl))
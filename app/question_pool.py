@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import cast
+from sqlalchemy.dialects.postgresql import BIT, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+
+from app import database, models
+
+load_dotenv()
+
+FLUSH_INTERVAL = float(os.getenv("QUESTION_POOL_FLUSH_INTERVAL", 5))
+MAX_CACHED_USERS = int(os.getenv("QUESTION_POOL_MAX_USERS", 50000))
+# Cached bitmaps are re-read after this long to pick up answers flushed by
+# other workers
+CACHE_TTL = float(os.getenv("QUESTION_POOL_CACHE_TTL", 30))
+RANDOM_PROBES = 8
+# load() looks this many ids below the newest one it holds, so questions
+# whose transactions committed out of order are not skipped for good
+RELOAD_WINDOW = 1000
+# Rows per upsert; each row binds 3 parameters and asyncpg allows 32767
+FLUSH_BATCH_ROWS = 5000
+
+# Dense array of active question ids plus its reverse index, so a random
+# question is one randint away. Each worker process keeps its own copy and
+# picks up questions created elsewhere on every flush. _created holds each
+# question's created_at (microseconds since the epoch) in the same slot,
+# so lookups can name the partition the row lives in.
+_ids = array("q")
+_created = array("q")
+_positions: dict[int, int] = {}
+_newest = 0
+# Chunks below the lowest live question id hold only archived questions
+_lowest_chunk = 0
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Answered questions per user, split into chunks of CHUNK_BITS ids so a
+# user's bitmap only spans the ranges they actually answered in. In memory
+# each chunk is an int with bit n set for question chunk * CHUNK_BITS + n;
+# in question_seen it is one bit varying row per (user, chunk), written
+# most significant bit first. flush() ORs them into the stored rows in
+# batches, so workers never overwrite each other's bits.
+CHUNK_SHIFT = 13
+CHUNK_BITS = 1 << CHUNK_SHIFT
+_seen: "OrderedDict[int, dict[int, int]]" = OrderedDict()
+_loaded_at: dict[int, float] = {}
+# user -> chunks changed since the last flush
+_dirty: dict[int, set[int]] = {}
+# Users whose chunks are being written by flush(); not evictable either
+_flushing: set[int] = set()
+
+# bit varying stores the first bit of each byte in its high bit, Python
+# ints in the low one
+_REVERSED = bytes(int(f"{byte:08b}"[::-1], 2) for byte in range(256))
+
+
+def add(question_id: int, created_at: datetime):
+    global _newest
+    if question_id in _positions:
+        return
+    _newest = max(_newest, question_id)
+    _positions[question_id] = len(_ids)
+    _ids.append(question_id)
+    _created.append((created_at - _EPOCH) // timedelta(microseconds=1))
+
+
+def discard(question_id: int):
+    """Drops an archived question, moving the last id into its slot."""
+    position = _positions.pop(question_id, None)
+    if position is None:
+        return
+    last = _ids.pop()
+    created = _created.pop()
+    if last != question_id:
+        _ids[position] = last
+        _created[position] = created
+        _positions[last] = position
+
+
+def created_at(question_id: int) -> datetime | None:
+    """created_at of a pooled question, or None if this worker does not know it."""
+    position = _positions.get(question_id)
+    if position is None:
+        return None
+    return _EPOCH + timedelta(microseconds=_created[position])
+
+
+def _is_set(chunks: dict[int, int], question_id: int) -> bool:
+    return bool(chunks.get(question_id >> CHUNK_SHIFT, 0) >> (question_id & (CHUNK_BITS - 1)) & 1)
+
+
+def _set(chunks: dict[int, int], question_id: int) -> bool:
+    chunk = question_id >> CHUNK_SHIFT
+    bits = chunks.get(chunk, 0)
+    mask = 1 << (question_id & (CHUNK_BITS - 1))
+    if bits & mask:
+        return False
+    chunks[chunk] = bits | mask
+    return True
+
+
+def _encode(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little").translate(_REVERSED)
+
+
+def _decode(stored: bytes) -> int:
+    return int.from_bytes(stored.translate(_REVERSED), "little")
+
+
+def _merge(chunks: dict[int, int], chunk: int, stored: bytes):
+    if chunk >= _lowest_chunk:
+        chunks[chunk] = chunks.get(chunk, 0) | _decode(stored)
+
+
+async def load(db: AsyncSession):
+    """Loads ids from just below the newest one already held in memory."""
+    global _lowest_chunk
+    result = await db.execute(
+        select(models.Question.id, models.Question.created_at)
+        .filter(models.Question.id > _newest - RELOAD_WINDOW)
+        .order_by(models.Question.id)
+    )
+    for question_id, created in result:
+        add(question_id, created)
+    _lowest_chunk = min(_ids) >> CHUNK_SHIFT if _ids else 0
+
+
+async def _bitmap(db: AsyncSession, user_id: int) -> dict[int, int]:
+    chunks = _seen.get(user_id)
+    if chunks is not None and time.monotonic() - _loaded_at[user_id] < CACHE_TTL:
+        _seen.move_to_end(user_id)
+        return chunks
+
+    result = await db.execute(
+        select(models.QuestionSeen.chunk, models.QuestionSeen.bitmap)
+        .filter(models.QuestionSeen.user_id == user_id, models.QuestionSeen.chunk >= _lowest_chunk)
+    )
+    stored = result.all()
+    # Another request for the same user may have loaded it while we waited,
+    # and bits not flushed yet must survive the reload
+    chunks = _seen.setdefault(user_id, {})
+    for chunk, bits in stored:
+        _merge(chunks, chunk, bits.bytes)
+    _seen.move_to_end(user_id)
+    _loaded_at[user_id] = time.monotonic()
+    _evict(keep=user_id)
+    return chunks
+
+
+def _evict(keep: int):
+    # Only clean bitmaps can be dropped; dirty ones wait for the next flush.
+    while len(_seen) > MAX_CACHED_USERS:
+        for user_id in _seen:
+            if user_id != keep and user_id not in _dirty and user_id not in _flushing:
+                del _seen[user_id]
+                del _loaded_at[user_id]
+                break
+        else:
+            return
+
+
+async def next_unseen(db: AsyncSession, user_id: int):
+    """
+    Returns the id of a random question the user has not answered yet, or
+    None when they have answered them all.
+
+    A handful of random probes finds an unseen id in O(1) while most of the
+    pool is unseen; only users close to exhausting it fall back to a walk
+    over the in-memory array.
+    """
+    if not _ids:
+        return None
+    chunks = await _bitmap(db, user_id)
+
+    for _ in range(RANDOM_PROBES):
+        question_id = _ids[random.randrange(len(_ids))]
+        if not _is_set(chunks, question_id):
+            return question_id
+
+    start = random.randrange(len(_ids))
+    for offset in range(len(_ids)):
+        question_id = _ids[(start + offset) % len(_ids)]
+        if not _is_set(chunks, question_id):
+            return question_id
+    return None
+
+
+async def mark_seen(db: AsyncSession, user_id: int, question_id: int) -> bool:
+    """Records an answered question; returns True the first time the user answers it."""
+    chunks = await _bitmap(db, user_id)
+    if not _set(chunks, question_id):
+        return False
+    _dirty.setdefault(user_id, set()).add(question_id >> CHUNK_SHIFT)
+    return True
+
+
+def _padded(bits, other):
+    # | needs both bit strings to be the same length
+    zeros = func.repeat("0", func.greatest(func.length(other) - func.length(bits), 0))
+    return bits.op("||")(cast(zeros, BIT(varying=True)))
+
+
+async def flush():
+    if not _dirty:
+        return
+    pending = dict(_dirty)
+    _dirty.clear()
+    _flushing.update(pending)
+    rows = [
+        {"user_id": user_id, "chunk": chunk, "bitmap": _encode(_seen[user_id][chunk])}
+        for user_id, chunks in pending.items()
+        for chunk in chunks
+    ]
+
+    table = models.QuestionSeen.__table__
+    stored = []
+    try:
+        async with database.AsyncSessionLocal() as db:
+            for start in range(0, len(rows), FLUSH_BATCH_ROWS):
+                stmt = insert(table).values(rows[start:start + FLUSH_BATCH_ROWS])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[table.c.user_id, table.c.chunk],
+                    set_={
+                        "bitmap": _padded(table.c.bitmap, stmt.excluded.bitmap).op("|")(_padded(stmt.excluded.bitmap, table.c.bitmap)),
+                        "updated_at": func.now(),
+                    },
+                ).returning(table.c.user_id, table.c.chunk, table.c.bitmap)
+                stored.extend((await db.execute(stmt)).all())
+            await db.commit()
+    except BaseException:
+        # ORing the same bits in twice is harmless, so everything is
+        # retried, including after a cancellation at shutdown
+        for user_id, chunks in pending.items():
+            _dirty.setdefault(user_id, set()).update(chunks)
+        raise
+    finally:
+        _flushing.difference_update(pending)
+
+    # The merged rows include answers flushed by other workers
+    now = time.monotonic()
+    for user_id, chunk, bits in stored:
+        if user_id in _seen:
+            _merge(_seen[user_id], chunk, bits.bytes)
+            _loaded_at[user_id] = now
+
+
+async def run_flusher():
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush()
+            async with database.AsyncSessionLocal() as db:
+                await load(db)
+        except Exception:
+            logging.exception("Failed to flush question pool")
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+
+from app import database, models
+
+load_dotenv()
+
+FLUSH_INTERVAL = float(os.getenv("QUESTION_STATS_FLUSH_INTERVAL", 5))
+# Rows per upsert; each row binds 4 parameters and asyncpg allows 32767
+FLUSH_BATCH_ROWS = 5000
+
+# question_id -> [attempts, correct, distinct_users] not yet written to
+# question_stats.
+_pending: dict[int, list[int]] = {}
+# The write started by the last flush(), until it is known to have finished
+_writing: asyncio.Task | None = None
+
+SORT_COLUMNS = {
+    "attempts": models.QuestionStats.attempts,
+    "correct": models.QuestionStats.correct,
+    "distinct_users": models.QuestionStats.distinct_users,
+    "accuracy": models.QuestionStats.accuracy,
+}
+
+
+def record(question_id: int, correct: bool, first_attempt: bool):
+    counters = _pending.get(question_id)
+    if counters is None:
+        counters = _pending[question_id] = [0, 0, 0]
+    counters[0] += 1
+    counters[1] += int(correct)
+    counters[2] += int(first_attempt)
+
+
+async def get_stats(db: AsyncSession, question_id: int):
+    """Flushed counters for one question plus whatever is still buffered in this process."""
+    result = await db.execute(select(models.QuestionStats).filter(models.QuestionStats.question_id == question_id))
+    stats = result.scalars().first()
+    pending = _pending.get(question_id)
+    if pending is None:
+        return stats
+
+    if stats is None:
+        stats = models.QuestionStats(question_id=question_id, attempts=0, correct=0, distinct_users=0)
+    else:
+        db.expunge(stats)
+    stats.attempts += pending[0]
+    stats.correct += pending[1]
+    stats.distinct_users += pending[2]
+    return stats
+
+
+async def list_stats(db: AsyncSession, sort_by: str = "attempts", descending: bool = True, skip: int = 0, limit: int = 10):
+    column = SORT_COLUMNS[sort_by]
+    tie_breaker = models.QuestionStats.question_id
+    if descending:
+        order = (column.desc(), tie_breaker.desc())
+    else:
+        order = (column.asc(), tie_breaker.asc())
+    result = await db.execute(
+        select(models.QuestionStats)
+        .order_by(*order)
+        .offset(skip)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def _write(batch: dict[int, list[int]]):
+    table = models.QuestionStats.__table__
+    rows = [
+        {"question_id": question_id, "attempts": attempts, "correct": correct, "distinct_users": users}
+        for question_id, (attempts, correct, users) in batch.items()
+    ]
+    try:
+        async with database.AsyncSessionLocal() as db:
+            for start in range(0, len(rows), FLUSH_BATCH_ROWS):
+                stmt = insert(table).values(rows[start:start + FLUSH_BATCH_ROWS])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[table.c.question_id],
+                    set_={
+                        "attempts": table.c.attempts + stmt.excluded.attempts,
+                        "correct": table.c.correct + stmt.excluded.correct,
+                        "distinct_users": table.c.distinct_users + stmt.excluded.distinct_users,
+                        "updated_at": func.now(),
+                    },
+                )
+                await db.execute(stmt)
+            await db.commit()
+    except Exception:
+        # Not committed, so the counters go back for the next flush
+        for question_id, (attempts, correct, users) in batch.items():
+            counters = _pending.setdefault(question_id, [0, 0, 0])
+            counters[0] += attempts
+            counters[1] += correct
+            counters[2] += users
+        raise
+
+
+async def flush():
+    global _writing
+    if _writing is not None:
+        # A write whose flush was cancelled keeps running; let it land
+        # first so its batch is neither lost nor added twice
+        await asyncio.wait([_writing])
+        if not _writing.cancelled() and _writing.exception() is not None:
+            logging.error("Failed to flush question stats", exc_info=_writing.exception())
+        _writing = None
+    if not _pending:
+        return
+    batch = dict(_pending)
+    _pending.clear()
+    # The counters are added, not set, so a write must either finish or be
+    # known to have failed; cancelling it mid-commit could count it twice
+    _writing = asyncio.ensure_future(_write(batch))
+    try:
+        await asyncio.shield(_writing)
+    finally:
+        if _writing.done():
+            _writing = None
+
+
+async def run_flusher():
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush()
+        except Exception:
+            logging.exception("Failed to flush question stats")
@@ -44,6 +44,8 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     phone_number: str | None = None
+    user_id: int | None = None
+    is_admin: bool = False
 
 class NewsBase(BaseModel):
     title: str
@@ -77,6 +79,10 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+class ImageUpload(BaseModel):
+    image_url: str
+    variants: dict[str, str]
+
 class QuestionBase(BaseModel):
     text: str
     answer: str
@@ -91,8 +97,9 @@ class Question(QuestionBase):
     class Config:
         from_attributes = True
 
-class QuestionPublic(QuestionBase):
+class QuestionPublic(BaseModel):
     id: int
+    text: str
     created_at: datetime
     # answer is excluded
 
@@ -105,3 +112,13 @@ class AnswerCheck(BaseModel):
 class AnswerResult(BaseModel):
     correct: bool
     message: str
+
+class QuestionStats(BaseModel):
+    question_id: int
+    attempts: int
+    correct: int
+    distinct_users: int
+    accuracy: float | None = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,137 @@
+"""
+Benchmarks crud.get_active_products against a large product catalogue.
+
+Seeds a scratch schema with --rows products (default 1M, a few with no
+name or price) using generate_series, builds the same tables and indexes as the models, then
+runs every supported filter/sort combination: the first page, and a deep
+page reached through the keyset cursor. For each it prints the median
+latency and the scan nodes of the plan, so a regression to a seq scan or a
+full sort shows up directly.
+
+    python -m benchmarks.products_catalogue [--rows 1000000] [--repeat 20] [--keep]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, database, models
+
+SCHEMA = "bench_products"
+
+SEED_SQL = f"""
+INSERT INTO {SCHEMA}.products (name, description, price, image_url, publish_at)
+SELECT
+    CASE WHEN g % 997 = 0 THEN NULL ELSE substr(md5(g::text), 1, 12) END,
+    'benchmark product ' || g,
+    CASE WHEN g % 991 = 0 THEN NULL ELSE round((random() * 1000)::numeric, 2) END,
+    NULL,
+    now() - (random() * interval '730 days') + CASE WHEN g % 20 = 0 THEN interval '365 days' ELSE interval '0' END
+FROM generate_series(1, :rows) AS g
+"""
+
+COMBINATIONS = {
+    "newest first": dict(sort="publish_at", descending=True),
+    "price asc": dict(sort="price"),
+    "price desc": dict(sort="price", descending=True),
+    "price range": dict(sort="price", min_price=100, max_price=120),
+    "price range, newest": dict(sort="publish_at", descending=True, min_price=100, max_price=120),
+    "name": dict(sort="name"),
+    "name prefix": dict(sort="name", name_prefix="ab"),
+    "name prefix, price cap": dict(sort="name", name_prefix="ab", max_price=500),
+}
+
+
+def _plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+async def _explain(conn, run) -> list[str]:
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(conn.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        async with AsyncSession(bind=conn) as db:
+            await run(db)
+    finally:
+        event.remove(conn.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+    statement, parameters = captured[-1]
+    result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return [
+        f"{node['Node Type']}({node.get('Index Name', node.get('Relation Name', ''))})"
+        for node in _plan_nodes(plan[0]["Plan"])
+        if "Scan" in node["Node Type"] or node["Node Type"] == "Sort"
+    ]
+
+
+async def _time(conn, run, repeat: int) -> float:
+    timings = []
+    async with AsyncSession(bind=conn) as db:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await run(db)
+            timings.append((time.perf_counter() - started) * 1000)
+            db.expunge_all()
+    return statistics.median(timings)
+
+
+async def main(rows: int, repeat: int, keep: bool):
+    engine = database.engine.execution_options(schema_translate_map={None: SCHEMA})
+    async with engine.connect() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.run_sync(lambda sync_conn: models.Product.__table__.create(sync_conn))
+        started = time.perf_counter()
+        await conn.execute(text(SEED_SQL), {"rows": rows})
+        await conn.execute(text(f"ANALYZE {SCHEMA}.products"))
+        await conn.commit()
+        print(f"Seeded {rows} products in {time.perf_counter() - started:.1f}s\n")
+
+        now = datetime.now(timezone.utc)
+        print(f"{'combination':<26} {'page 1 ms':>10} {'page 50 ms':>11}  plan")
+        for name, options in COMBINATIONS.items():
+            first_page = lambda db, options=options: crud.get_active_products(db, now, limit=20, **options)
+
+            # Walk 49 pages through the cursor to find the start of page 50
+            after = None
+            async with AsyncSession(bind=conn) as db:
+                for _ in range(49):
+                    page = await crud.get_active_products(db, now, limit=20, after=after, **options)
+                    if not page:
+                        break
+                    after = crud.decode_product_cursor(crud.encode_product_cursor(page[-1], options["sort"]), options["sort"])
+            deep_page = lambda db, options=options, after=after: crud.get_active_products(db, now, limit=20, after=after, **options)
+
+            first_ms = await _time(conn, first_page, repeat)
+            deep_ms = await _time(conn, deep_page, repeat)
+            plan = await _explain(conn, deep_page)
+            print(f"{name:<26} {first_ms:>10.2f} {deep_ms:>11.2f}  {' > '.join(plan)}")
+            await conn.rollback()
+
+        if not keep:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+            await conn.commit()
+    await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="leave the seeded schema in place")
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat, args.keep))
@@ -0,0 +1,191 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from asyncpg import BitString
+from sqlalchemy.dialects import postgresql
+
+from app import question_pool
+
+CREATED = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeSession:
+    """Answers every execute() with `rows` and records the statements."""
+
+    def __init__(self, rows=(), fail=False):
+        self.rows = list(rows)
+        self.fail = fail
+        self.statements = []
+        self.committed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("database is down")
+        return FakeResult(self.rows)
+
+    async def commit(self):
+        self.committed = True
+
+
+@pytest.fixture(autouse=True)
+def empty_pool(monkeypatch):
+    for name in ("_positions", "_seen", "_loaded_at", "_dirty"):
+        getattr(question_pool, name).clear()
+    question_pool._flushing.clear()
+    del question_pool._ids[:]
+    del question_pool._created[:]
+    monkeypatch.setattr(question_pool, "_newest", 0)
+    monkeypatch.setattr(question_pool, "_lowest_chunk", 0)
+
+
+def stored(chunks_by_user):
+    """question_seen rows as asyncpg returns them."""
+    return [
+        (user_id, chunk, BitString.frombytes(question_pool._encode(bits)))
+        for user_id, chunks in chunks_by_user.items()
+        for chunk, bits in chunks.items()
+    ]
+
+
+def test_encoding_matches_postgres_bit_order():
+    bits = (1 << 0) | (1 << 9) | (1 << 8191)
+    encoded = question_pool._encode(bits)
+    positions = BitString.frombytes(encoded).as_string().replace(" ", "")
+    assert [n for n, bit in enumerate(positions) if bit == "1"] == [0, 9, 8191]
+    assert question_pool._decode(encoded) == bits
+
+
+def test_bitmap_only_spans_the_chunks_answered_in():
+    chunks = {}
+    assert question_pool._set(chunks, 1_000_000)
+    assert not question_pool._set(chunks, 1_000_000)
+    assert list(chunks) == [1_000_000 >> question_pool.CHUNK_SHIFT]
+    assert len(question_pool._encode(chunks[1_000_000 >> question_pool.CHUNK_SHIFT])) <= question_pool.CHUNK_BITS // 8
+    assert question_pool._is_set(chunks, 1_000_000)
+    assert not question_pool._is_set(chunks, 999_999)
+    assert not question_pool._is_set(chunks, 1)
+
+
+def test_discard_keeps_ids_and_created_at_aligned():
+    for question_id in (1, 2, 3):
+        question_pool.add(question_id, CREATED.replace(day=question_id))
+    question_pool.discard(1)
+    question_pool.discard(42)
+
+    assert sorted(question_pool._ids) == [2, 3]
+    assert question_pool.created_at(1) is None
+    assert question_pool.created_at(3) == CREATED.replace(day=3)
+    for question_id, position in question_pool._positions.items():
+        assert question_pool._ids[position] == question_id
+
+
+def test_next_unseen_skips_answered_questions():
+    for question_id in (1, 2, 3):
+        question_pool.add(question_id, CREATED)
+
+    async def run():
+        db = FakeSession()
+        assert await question_pool.mark_seen(db, 7, 1)
+        assert await question_pool.mark_seen(db, 7, 3)
+        assert not await question_pool.mark_seen(db, 7, 3)
+        assert {await question_pool.next_unseen(db, 7) for _ in range(20)} == {2}
+        await question_pool.mark_seen(db, 7, 2)
+        assert await question_pool.next_unseen(db, 7) is None
+
+    asyncio.run(run())
+
+
+def test_reload_keeps_unflushed_bits(monkeypatch):
+    async def run():
+        assert await question_pool.mark_seen(FakeSession(), 7, 5)
+        question_pool._loaded_at[7] -= question_pool.CACHE_TTL + 1
+        # Another worker flushed question 6
+        await question_pool._bitmap(FakeSession([(0, BitString.frombytes(question_pool._encode(1 << 6)))]), 7)
+
+    asyncio.run(run())
+    assert question_pool._seen[7] == {0: (1 << 5) | (1 << 6)}
+
+
+def test_eviction_spares_dirty_in_flight_and_current_users(monkeypatch):
+    monkeypatch.setattr(question_pool, "MAX_CACHED_USERS", 2)
+
+    async def run():
+        await question_pool.mark_seen(FakeSession(), 1, 1)
+        question_pool._flushing.add(2)
+        await question_pool._bitmap(FakeSession(), 2)
+        await question_pool._bitmap(FakeSession(), 3)
+        assert list(question_pool._seen) == [1, 2, 3]
+        question_pool._flushing.clear()
+        await question_pool._bitmap(FakeSession(), 4)
+
+    asyncio.run(run())
+    assert list(question_pool._seen) == [1, 4]
+
+
+def test_flush_ors_into_stored_rows_in_batches(monkeypatch):
+    monkeypatch.setattr(question_pool, "FLUSH_BATCH_ROWS", 2)
+    session = FakeSession(stored({1: {0: (1 << 1) | (1 << 2)}}))
+    monkeypatch.setattr(question_pool.database, "AsyncSessionLocal", lambda: session)
+
+    async def run():
+        for user_id in (1, 2, 3):
+            await question_pool.mark_seen(FakeSession(), user_id, 1)
+        await question_pool.flush()
+
+    asyncio.run(run())
+    assert len(session.statements) == 2 and session.committed
+    sql = str(session.statements[0].compile(dialect=postgresql.asyncpg.dialect()))
+    assert "ON CONFLICT (user_id, chunk) DO UPDATE SET bitmap = ((question_seen.bitmap ||" in sql
+    assert ") | (excluded.bitmap ||" in sql
+    assert not question_pool._dirty and not question_pool._flushing
+    # The merged row carries question 2, flushed earlier by another worker
+    assert question_pool._seen[1] == {0: (1 << 1) | (1 << 2)}
+
+
+def test_failed_flush_keeps_users_dirty_and_cached(monkeypatch):
+    monkeypatch.setattr(question_pool, "MAX_CACHED_USERS", 1)
+    monkeypatch.setattr(question_pool.database, "AsyncSessionLocal", lambda: FakeSession(fail=True))
+
+    async def load_others():
+        await asyncio.sleep(0)
+        await question_pool._bitmap(FakeSession(), 2)
+        await question_pool._bitmap(FakeSession(), 3)
+
+    async def run():
+        await question_pool.mark_seen(FakeSession(), 1, 5)
+        return await asyncio.gather(question_pool.flush(), load_others(), return_exceptions=True)
+
+    failure, _ = asyncio.run(run())
+    assert isinstance(failure, RuntimeError)
+    assert question_pool._dirty == {1: {0}}
+    assert 1 in question_pool._seen and not question_pool._flushing
+
+
+def test_load_looks_below_the_newest_id(monkeypatch):
+    question_pool.add(101, CREATED)
+    session = FakeSession([(100, CREATED), (101, CREATED)])
+    asyncio.run(question_pool.load(session))
+
+    sql = session.statements[0].compile(dialect=postgresql.asyncpg.dialect())
+    assert sql.params["id_1"] == 101 - question_pool.RELOAD_WINDOW
+    assert sorted(question_pool._ids) == [100, 101]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app import question_stats
+
+
+class SlowSession:
+    """Records what each committed transaction would have added."""
+
+    def __init__(self, committed, fail=False):
+        self.committed = committed
+        self.fail = fail
+        self.statements = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        await asyncio.sleep(0.05)
+        if self.fail:
+            raise RuntimeError("database is down")
+        self.statements.append(statement)
+
+    async def commit(self):
+        await asyncio.sleep(0.05)
+        for statement in self.statements:
+            for row in statement._multi_values[0]:
+                question_id = next(value for column, value in row.items() if getattr(column, "key", column) == "question_id")
+                self.committed[question_id] = self.committed.get(question_id, 0) + 1
+
+
+@pytest.fixture(autouse=True)
+def empty_buffer(monkeypatch):
+    question_stats._pending.clear()
+    monkeypatch.setattr(question_stats, "_writing", None)
+
+
+def test_cancelled_flush_is_written_once(monkeypatch):
+    committed = {}
+    monkeypatch.setattr(question_stats.database, "AsyncSessionLocal", lambda: SlowSession(committed))
+
+    async def run():
+        question_stats.record(1, True, True)
+        flusher = asyncio.ensure_future(question_stats.flush())
+        # Cancel while the commit is in flight, as shutdown does
+        await asyncio.sleep(0.07)
+        flusher.cancel()
+        await asyncio.gather(flusher, return_exceptions=True)
+        question_stats.record(2, False, True)
+        await question_stats.flush()
+
+    asyncio.run(run())
+    assert committed == {1: 1, 2: 1}
+    assert not question_stats._pending
+
+
+def test_failed_write_puts_counters_back(monkeypatch):
+    monkeypatch.setattr(question_stats.database, "AsyncSessionLocal", lambda: SlowSession({}, fail=True))
+
+    async def run():
+        question_stats.record(1, True, True)
+        with pytest.raises(RuntimeError):
+            await question_stats.flush()
+        question_stats.record(1, False, False)
+
+    asyncio.run(run())
+    assert question_stats._pending == {1: [2, 1, 1]}
+    assert question_stats._writing is None